@@ -10,6 +10,7 @@ import (
 	"os/exec"
 	"path/filepath"
 	"sort"
+	"strconv"
 	"time"
 )
 
@@ -20,7 +21,9 @@ type Query struct {
 }
 
 type Config struct {
-	Queries []Query `json:"queries"`
+	Queries      []Query `json:"queries"`
+	ScrapeBudget int     `json:"scrape_budget"` // 每个时间窗口最多执行的查询数，0 表示全部执行
+	Pipeline     bool    `json:"pipeline"`      // 用 pipeline.py 在一个进程内流水线执行本窗口的全部查询
 }
 
 var timeWindows = [][2]int{
@@ -157,11 +160,39 @@ func runAllQueries(baseDir string, logger *log.Logger) {
 		logger.Println("no queries configured")
 		return
 	}
-	for _, q := range cfg.Queries {
+	queries := cfg.Queries
+	if cfg.ScrapeBudget > 0 {
+		planned, err := planQueries(baseDir, cfg.ScrapeBudget)
+		if err != nil {
+			logger.Printf("plan queries failed, running all: %v", err)
+		} else {
+			logger.Printf("planned %d of %d queries (budget %d)", len(planned), len(cfg.Queries), cfg.ScrapeBudget)
+			queries = planned
+		}
+	}
+	if cfg.Pipeline {
+		runPipeline(baseDir, queries, logger)
+		return
+	}
+	for _, q := range queries {
 		runQuery(baseDir, q, logger)
 	}
 }
 
+// planQueries 调用 scheduler.py 按价值挑选本窗口要执行的查询
+func planQueries(baseDir string, budget int) ([]Query, error) {
+	pythonBin := findPython(baseDir)
+	cmd := exec.Command(pythonBin, filepath.Join(baseDir, "scheduler.py"), "--budget", strconv.Itoa(budget), "--json")
+	cmd.Dir = baseDir
+	out, err := cmd.Output()
+	if err != nil {
+		return nil, err
+	}
+	var planned []Query
+	err = json.Unmarshal(out, &planned)
+	return planned, err
+}
+
 func runQuery(baseDir string, q Query, logger *log.Logger) {
 	if q.From == "" || q.To == "" || q.Date == "" {
 		logger.Printf("skip invalid query: %+v", q)
@@ -179,3 +210,24 @@ func runQuery(baseDir string, q Query, logger *log.Logger) {
 	}
 	logger.Printf("query done")
 }
+
+func runPipeline(baseDir string, queries []Query, logger *log.Logger) {
+	args := []string{filepath.Join(baseDir, "pipeline.py"), "--headless"}
+	for _, q := range queries {
+		if q.From == "" || q.To == "" || q.Date == "" {
+			logger.Printf("skip invalid query: %+v", q)
+			continue
+		}
+		args = append(args, "--query", q.From+":"+q.To+":"+q.Date)
+	}
+	logger.Printf("run pipeline with %d queries", (len(args)-2)/2)
+	cmd := exec.Command(findPython(baseDir), args...)
+	cmd.Dir = baseDir
+	cmd.Stdout = logger.Writer()
+	cmd.Stderr = logger.Writer()
+	if err := cmd.Run(); err != nil {
+		logger.Printf("pipeline failed: %v", err)
+		return
+	}
+	logger.Printf("pipeline done")
+}
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+价格提醒：按航班维护滚动统计（最低、最高、最新、EWMA、次数），每次查询结果写入时 O(1) 更新，
+对新价格逐条评估规则，触发后通过可插拔的本地通道（文件 / webhook）通知。
+
+config.json 示例：
+    "alerts": {
+        "rules": [
+            {"type": "below", "price": 4500, "from": "sha", "to": "akl"},
+            {"type": "new_low"},
+            {"type": "drop_pct", "pct": 8}
+        ],
+        "sinks": [
+            {"type": "file", "path": "alerts.jsonl"},
+            {"type": "webhook", "url": "http://127.0.0.1:9000/alerts"}
+        ]
+    }
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+from urllib.request import Request, urlopen
+
+from cities import city_name
+from history_sink import FileLock, sheet_name_for
+from history_reader import iter_history_rows, parse_query_time, parse_price
+
+EWMA_ALPHA = 0.3  # 新价格在 EWMA 中的权重
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+class RollingStats:
+    """单个航班的滚动统计，更新为 O(1)，持久化为 [n, min, max, last, ewma, last_time]"""
+
+    __slots__ = ('n', 'min', 'max', 'last', 'ewma', 'last_time')
+
+    def __init__(self, n=0, min=None, max=None, last=None, ewma=None, last_time=None):
+        self.n = n
+        self.min = min
+        self.max = max
+        self.last = last
+        self.ewma = ewma
+        self.last_time = last_time
+
+    def update(self, price, query_time, alpha=EWMA_ALPHA):
+        if self.n == 0:
+            self.min = self.max = self.ewma = price
+        else:
+            self.min = min(self.min, price)
+            self.max = max(self.max, price)
+            self.ewma = alpha * price + (1 - alpha) * self.ewma
+        self.last = price
+        self.last_time = query_time
+        self.n += 1
+
+    def to_list(self):
+        return [self.n, self.min, self.max, self.last, round(self.ewma, 2), self.last_time]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def to_dict(self):
+        return {'n': self.n, 'min': self.min, 'max': self.max, 'last': self.last,
+                'ewma': round(self.ewma, 2), 'last_time': self.last_time}
+
+
+class FileSink:
+    """把提醒逐行追加到 JSON Lines 文件"""
+
+    def __init__(self, path='alerts.jsonl'):
+        self.path = path
+
+    def send(self, alert):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(alert, ensure_ascii=False) + '\n')
+
+
+class WebhookSink:
+    """把提醒以 JSON POST 到本地 webhook 地址"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        data = json.dumps(alert, ensure_ascii=False).encode('utf-8')
+        req = Request(self.url, data=data, headers={'Content-Type': 'application/json; charset=utf-8'})
+        with urlopen(req, timeout=self.timeout):
+            pass
+
+
+SINK_TYPES = {
+    'file': lambda cfg: FileSink(cfg.get('path', 'alerts.jsonl')),
+    'webhook': lambda cfg: WebhookSink(cfg['url'], cfg.get('timeout', 5)),
+}
+
+
+def rule_matches(rule, dep_city_label, arr_city_label, dep_date, flight_no):
+    """规则可选按 from / to / date / flight 限定范围，城市既可写代码也可写中文名"""
+    if rule.get('from') and city_name(rule['from']) != dep_city_label:
+        return False
+    if rule.get('to') and city_name(rule['to']) != arr_city_label:
+        return False
+    if rule.get('date') and rule['date'] != dep_date:
+        return False
+    if rule.get('flight') and rule['flight'].upper() != flight_no.upper():
+        return False
+    return True
+
+
+def evaluate_rule(rule, price, prev):
+    """
+    评估单条规则
+    :param prev: 更新前的统计，首次出现的航班为 None
+    :return: 提醒文字，未触发返回 None
+    """
+    rule_type = rule.get('type')
+    if rule_type == 'below':
+        threshold = float(rule['price'])
+        # 只在价格跌破阈值的那一次提醒，持续低于阈值不重复提醒
+        if price < threshold and (prev is None or prev.last >= threshold):
+            return f"价格 ¥{price:.0f} 低于阈值 ¥{threshold:.0f}"
+    elif rule_type == 'new_low':
+        if prev is not None and price < prev.min:
+            return f"价格 ¥{price:.0f} 创历史新低（此前最低 ¥{prev.min:.0f}）"
+    elif rule_type == 'drop_pct':
+        pct = float(rule['pct'])
+        if prev is not None and price <= prev.ewma * (1 - pct / 100):
+            return f"价格 ¥{price:.0f} 比均值 ¥{prev.ewma:.0f} 低 {(1 - price / prev.ewma) * 100:.1f}%"
+    return None
+
+
+class AlertEngine:
+    """
+    按航班维护滚动统计并评估提醒规则
+    统计持久化到 stats_file，读改写在文件锁内完成，多个查询进程可同时使用
+    """
+
+    def __init__(self, rules=None, sinks=None, stats_file='flights_stats.json'):
+        self.rules = rules or []
+        self.sinks = sinks or []
+        self.stats_file = stats_file
+
+    def load_stats(self):
+        """读取统计，文件损坏时从空统计开始（可运行 alerts.py --rebuild 从历史记录恢复）"""
+        if not os.path.exists(self.stats_file):
+            return {}
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                return {key: RollingStats.from_list(values) for key, values in json.load(f).items()}
+        except (ValueError, TypeError, AttributeError) as e:
+            log_print(f"⚠ 统计文件 {self.stats_file} 无法解析，已忽略，"
+                      f"请运行 alerts.py --rebuild 从历史记录重建: {e}")
+            return {}
+
+    def save_stats(self, stats):
+        tmp_file = self.stats_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({key: s.to_list() for key, s in stats.items()}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, self.stats_file)
+
+    def observe(self, flights, dep_city_label, arr_city_label, dep_date, query_time=None):
+        """
+        处理一次查询的结果：逐个航班评估规则、更新统计、发送提醒
+        :return: 触发的提醒列表
+        """
+        query_time = query_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        alerts = []
+        with FileLock(self.stats_file):
+            stats = self.load_stats()
+            for flight in flights:
+                try:
+                    price = float(flight.get('price'))
+                except (TypeError, ValueError):
+                    continue
+                flight_no = flight.get('flight_number', 'N/A')
+                # 以历史记录中的 sheet 名称作为航班标识，与分析汇总和图表一致
+                key = sheet_name_for(dep_city_label, arr_city_label, dep_date, flight)
+                prev = stats.get(key)
+
+                for rule in self.rules:
+                    if not rule_matches(rule, dep_city_label, arr_city_label, dep_date, flight_no):
+                        continue
+                    message = evaluate_rule(rule, price, prev)
+                    if message:
+                        alerts.append({
+                            'time': query_time,
+                            'rule': rule.get('type'),
+                            'flight': key,
+                            'airline': flight.get('airline', 'N/A'),
+                            'price': price,
+                            'message': message,
+                            'stats': prev.to_dict() if prev else None,
+                        })
+
+                if prev is None:
+                    prev = stats[key] = RollingStats()
+                prev.update(price, query_time)
+            self.save_stats(stats)
+
+        for alert in alerts:
+            log_print(f"🔔 {alert['flight']} {alert['message']}")
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    log_print(f"⚠ 发送提醒到 {type(sink).__name__} 失败: {e}")
+        return alerts
+
+    def rebuild(self, excel_file='flights_history.xlsx'):
+        """
+        从历史记录重建统计（不发送提醒），用于首次启用或统计文件丢失时
+        逐行流式更新，内存只与航班数有关；EWMA 与顺序有关，每个 sheet 按追加顺序即查询时间顺序读取
+        """
+        stats = {}
+        required = ('查询时间', '价格(¥)')
+        for sheet_name, _, row in iter_history_rows(excel_file, required=required):
+            price = parse_price(row['价格(¥)'])
+            if price is None:
+                continue
+            query_time = parse_query_time(row['查询时间'])
+            query_time = query_time.strftime("%Y-%m-%d %H:%M:%S") if query_time else str(row['查询时间'])
+            stats.setdefault(sheet_name, RollingStats()).update(price, query_time)
+        with FileLock(self.stats_file):
+            self.save_stats(stats)
+        return stats
+
+
+def load_alert_engine(config_file='config.json'):
+    """根据 config.json 中的 alerts 配置创建提醒引擎，未配置时返回 None"""
+    if not os.path.exists(config_file):
+        return None
+    with open(config_file, 'r', encoding='utf-8') as f:
+        alerts_cfg = json.load(f).get('alerts')
+    if not alerts_cfg:
+        return None
+    sinks = []
+    for cfg in alerts_cfg.get('sinks', []):
+        sink_type = cfg.get('type')
+        if sink_type not in SINK_TYPES:
+            log_print(f"⚠ 忽略 alerts.sinks 中不支持的通道类型 {sink_type!r}（可选: {', '.join(SINK_TYPES)}）: {cfg}")
+            continue
+        sinks.append(SINK_TYPES[sink_type](cfg))
+    return AlertEngine(rules=alerts_cfg.get('rules', []), sinks=sinks,
+                       stats_file=alerts_cfg.get('stats_file', 'flights_stats.json'))
+
+
+# .venv\Scripts\python.exe alerts.py --rebuild
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="航班价格滚动统计与提醒")
+    parser.add_argument("--config", default="config.json", help="查询配置文件")
+    parser.add_argument("--rebuild", action="store_true", default=False,
+                        help="从历史记录重建统计")
+    parser.add_argument("--history", default="flights_history.xlsx", help="历史记录Excel文件")
+    args = parser.parse_args()
+
+    engine = load_alert_engine(args.config) or AlertEngine()
+    if args.rebuild:
+        stats = engine.rebuild(args.history)
+        log_print(f"✅ 已从 {args.history} 重建 {len(stats)} 个航班的统计")
+    else:
+        stats = engine.load_stats()
+
+    log_print(f"{'航班':<36} {'次数':>5} {'最低':>8} {'最高':>8} {'最新':>8} {'EWMA':>8}")
+    for key, s in sorted(stats.items()):
+        log_print(f"{key:<36} {s.n:>5} {s.min:>8.0f} {s.max:>8.0f} {s.last:>8.0f} {s.ewma:>8.0f}")
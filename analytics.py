@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨航班分析汇总：每个出发日期的最低价航班、各航班降价频率、最佳提前购买时间。
+汇总以可合并的聚合值保存在 {历史文件名}_summary.json 中，每次只分块流式读取各 sheet 新增的行增量更新，
+chart.py 直接读取汇总生成概览，不需要每次重新扫描全部历史。
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from history_reader import iter_history_rows, parse_query_time, parse_price, parse_flight_date
+from history_sink import FileLock
+
+SUMMARY_VERSION = 2     # 版本变化时旧汇总作废并从头计算
+LEAD_BUCKET_DAYS = 7   # 提前购买时间按周分组
+TOP_DROP_FLIGHTS = 10  # 概览中展示降价最频繁的航班数
+CHUNK_ROWS = 50000     # 增量读取时每块的行数
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+def summary_path(excel_file):
+    return os.path.splitext(excel_file)[0] + '_summary.json'
+
+
+def empty_summary():
+    return {
+        'version': SUMMARY_VERSION,
+        'watermarks': {},   # sheet -> 已处理的数据行数
+        'last_price': {},   # sheet -> 最后一次价格，用于跨批次计算涨跌
+        'cheapest': {},     # "航线|出发日期|查询日期" -> [最低价, 航班sheet]
+        'drops': {},        # sheet -> [价格变化次数, 降价次数]
+        'lead': {},         # "航线|提前周数" -> [价格合计, 次数]
+    }
+
+
+def load_summary(excel_file):
+    """读取已有汇总，文件损坏或版本不符时返回空汇总（下次刷新会从头计算）"""
+    path = summary_path(excel_file)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except ValueError as e:
+            log_print(f"⚠ 分析汇总 {path} 无法解析，将重新计算: {e}")
+            return empty_summary()
+        if summary.get('version') == SUMMARY_VERSION:
+            return summary
+    return empty_summary()
+
+
+def iter_new_row_chunks(excel_file, watermarks, chunk_size=CHUNK_ROWS):
+    """
+    流式读取每个 sheet 中水位线之后的新行，每 chunk_size 行合并为一个 DataFrame
+    同时推进 watermarks，内存占用只与块大小有关
+    时间、日期、价格用 history_reader 的解析函数逐行解析，与图表、提醒、调度接受相同的行
+    """
+    required = ('查询时间', '出发城市', '目的地', '出发日期', '价格(¥)')
+    columns = {'sheet': [], 'route': [], 'flight_date': [], 'query_time': [], 'price': []}
+
+    def make_frame():
+        frame = pd.DataFrame({
+            'sheet': columns['sheet'],
+            'route': columns['route'],
+            'flight_date': pd.to_datetime(pd.Series(columns['flight_date'], dtype=object), format='%Y-%m-%d'),
+            'query_time': pd.to_datetime(pd.Series(columns['query_time'], dtype=object)),
+            'price': pd.Series(columns['price'], dtype=float),
+        })
+        for values in columns.values():
+            values.clear()
+        return frame
+
+    for sheet_name, row_no, row in iter_history_rows(excel_file, required=required,
+                                                     start_rows=dict(watermarks)):
+        watermarks[sheet_name] = row_no
+        query_time = parse_query_time(row['查询时间'])
+        flight_date = parse_flight_date(row['出发日期'], sheet_name)
+        price = parse_price(row['价格(¥)'])
+        if query_time is None or flight_date is None or price is None:
+            continue
+        columns['sheet'].append(sheet_name)
+        columns['route'].append(f"{row['出发城市']}→{row['目的地']}")
+        columns['flight_date'].append(flight_date)
+        columns['query_time'].append(query_time)
+        columns['price'].append(price)
+        if len(columns['sheet']) >= chunk_size:
+            yield make_frame()
+    if columns['sheet']:
+        yield make_frame()
+
+
+def fold_rows(summary, rows):
+    """把新增的行合并进汇总（全部用 groupby 向量化计算）"""
+    rows = rows.assign(
+        query_day=rows['query_time'].dt.strftime('%Y-%m-%d'),
+        flight_day=rows['flight_date'].dt.strftime('%Y-%m-%d'),
+        lead_bucket=((rows['flight_date'] - rows['query_time'].dt.normalize()).dt.days // LEAD_BUCKET_DAYS),
+    )
+
+    # 每个 航线+出发日期+查询日期 的最低价航班
+    cheapest = summary['cheapest']
+    best = rows.loc[rows.groupby(['route', 'flight_day', 'query_day'])['price'].idxmin()]
+    for route, flight_day, query_day, price, sheet in zip(
+            best['route'], best['flight_day'], best['query_day'], best['price'], best['sheet']):
+        key = f"{route}|{flight_day}|{query_day}"
+        if key not in cheapest or price < cheapest[key][0]:
+            cheapest[key] = [float(price), sheet]
+
+    # 降价频率：与同一航班上一次价格比较，批次第一行接上次汇总时的最后价格
+    prev = rows.groupby('sheet')['price'].shift(1)
+    prev = prev.fillna(rows['sheet'].map(summary['last_price']))
+    changed = prev.notna() & (rows['price'] != prev)
+    dropped = rows['price'] < prev
+    counts = pd.DataFrame({'sheet': rows['sheet'], 'changed': changed, 'dropped': dropped}) \
+        .groupby('sheet')[['changed', 'dropped']].sum()
+    for sheet, n_changed, n_dropped in zip(counts.index, counts['changed'], counts['dropped']):
+        old = summary['drops'].get(sheet, [0, 0])
+        summary['drops'][sheet] = [old[0] + int(n_changed), old[1] + int(n_dropped)]
+    for sheet, price in rows.groupby('sheet')['price'].last().items():
+        summary['last_price'][sheet] = float(price)
+
+    # 提前购买时间：按 航线+提前周数 累计价格
+    lead = rows[rows['lead_bucket'] >= 0].groupby(['route', 'lead_bucket'])['price'].agg(['sum', 'count'])
+    for (route, bucket), total, count in zip(lead.index, lead['sum'], lead['count']):
+        key = f"{route}|{int(bucket)}"
+        old = summary['lead'].get(key, [0.0, 0])
+        summary['lead'][key] = [old[0] + float(total), old[1] + int(count)]
+
+
+def refresh_summary(excel_file='flights_history.xlsx', rebuild=False):
+    """
+    增量刷新汇总并写回文件
+    读改写在汇总文件锁内完成，多个进程同时生成图表时不会重复累计同一批新行
+    :param rebuild: 忽略已有汇总，从头计算
+    :return: 汇总
+    """
+    path = summary_path(excel_file)
+    with FileLock(path):
+        summary = empty_summary() if rebuild else load_summary(excel_file)
+        new_rows = 0
+        # 各块按 sheet 追加顺序依次合并，块之间的涨跌通过 last_price 衔接
+        for rows in iter_new_row_chunks(excel_file, summary['watermarks']):
+            if not rows.empty:
+                fold_rows(summary, rows)
+                new_rows += len(rows)
+        if new_rows:
+            log_print(f"✅ 分析汇总已更新 {new_rows} 条新记录")
+
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, path)
+    return summary
+
+
+def build_overview(summary):
+    """把汇总整理为图表页面概览使用的数据"""
+    # 每个 航线+出发日期：最近一次查询日的最低价航班，以及历史最低
+    by_date = {}
+    for key, (price, sheet) in summary['cheapest'].items():
+        route, flight_day, query_day = key.split('|')
+        item = by_date.setdefault((route, flight_day), {
+            'route': route, 'date': flight_day, 'query_day': '', 'price': None, 'flight': '',
+            'low_price': price, 'low_flight': sheet, 'low_day': query_day})
+        if query_day > item['query_day']:
+            item.update(query_day=query_day, price=price, flight=sheet)
+        if price < item['low_price']:
+            item.update(low_price=price, low_flight=sheet, low_day=query_day)
+    cheapest = [by_date[k] for k in sorted(by_date)]
+
+    drops = [
+        {'flight': sheet, 'changes': changed, 'drops': dropped, 'rate': round(dropped / changed, 3)}
+        for sheet, (changed, dropped) in summary['drops'].items() if changed
+    ]
+    drops.sort(key=lambda d: (d['rate'], d['drops']), reverse=True)
+
+    lead_by_route = {}
+    for key, (total, count) in summary['lead'].items():
+        route, bucket = key.split('|')
+        lead_by_route.setdefault(route, []).append((int(bucket), total / count, count))
+    best_lead = []
+    for route in sorted(lead_by_route):
+        buckets = sorted(lead_by_route[route])
+        bucket, avg, count = min(buckets, key=lambda b: b[1])
+        best_lead.append({
+            'route': route,
+            'days_from': bucket * LEAD_BUCKET_DAYS,
+            'days_to': (bucket + 1) * LEAD_BUCKET_DAYS - 1,
+            'avg_price': round(avg),
+            'samples': count,
+            'buckets': [[b * LEAD_BUCKET_DAYS, round(a)] for b, a, _ in buckets],
+        })
+
+    return {'cheapest': cheapest, 'drops': drops[:TOP_DROP_FLIGHTS], 'best_lead': best_lead}
+
+
+# .venv\Scripts\python.exe analytics.py
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="刷新跨航班分析汇总")
+    parser.add_argument("--history", default="flights_history.xlsx", help="历史记录Excel文件")
+    parser.add_argument("--rebuild", action="store_true", default=False, help="从头重新计算汇总")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.history):
+        log_print(f"❌ 文件 {args.history} 不存在")
+        raise SystemExit(1)
+
+    overview = build_overview(refresh_summary(args.history, rebuild=args.rebuild))
+    log_print("各出发日期最低价：")
+    for item in overview['cheapest']:
+        log_print(f"  {item['route']} {item['date']}  最新 ¥{item['price']:.0f} {item['flight']}  "
+                  f"历史最低 ¥{item['low_price']:.0f}（{item['low_day']}）")
+    log_print("降价最频繁的航班：")
+    for item in overview['drops']:
+        log_print(f"  {item['flight']}  {item['drops']}/{item['changes']} 次价格变化为降价")
+    log_print("最佳提前购买时间：")
+    for item in overview['best_lead']:
+        log_print(f"  {item['route']}  提前 {item['days_from']}-{item['days_to']} 天，平均 ¥{item['avg_price']}")
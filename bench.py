@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线压测：通过 replay.py 回放录制的页面，按不同并发度跑完整的 抓取 → 解析 → 保存 → 图表 流程，
+报告每分钟完成的查询数、各阶段耗时和内存峰值。
+每个并发度在独立的子进程中运行，内存峰值取该进程（及其 Chrome 子进程）的峰值 RSS。
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import shutil
+import statistics
+import tempfile
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+
+from cities import city_name
+from query import CTrip_FlightScraper, parse_flights, save_flights_to_file
+from chart import generate_flight_charts
+from history_sink import HistorySink
+from replay import start_replay_server
+
+STAGES = ['fetch', 'parse', 'json', 'commit', 'chart']
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+def replay_urls(store, base_url):
+    """把录制时的携程链接改写为回放服务地址，返回 [(出发城市, 到达城市, 日期, 链接)]"""
+    queries = []
+    for url in store.recordings:
+        parsed = urlparse(url)
+        dep_city, arr_city = parsed.path.rsplit('oneway-', 1)[-1].split('-')[:2]
+        dep_date = parse_qs(parsed.query).get('depdate', [''])[0]
+        queries.append((dep_city, arr_city, dep_date, f"{base_url}{parsed.path}?{parsed.query}"))
+    return queries
+
+
+def peak_rss():
+    """
+    返回 (本进程峰值RSS, 已退出子进程中的最大峰值RSS)，单位字节，无法获取时为 None
+    Windows 上需要安装 psutil，且只能取得本进程的峰值
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset, None
+        except (ImportError, AttributeError):
+            return None, None
+    # Linux 的 ru_maxrss 单位是 KB，macOS 是字节
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def run_level(queries, concurrency, work_dir, use_browser):
+    """
+    以指定并发度执行一轮查询
+    :return: (耗时秒数, {阶段: [耗时]}, 成功查询数)
+    """
+    timings = {stage: [] for stage in STAGES}
+    timings_lock = threading.Lock()
+    excel_file = os.path.join(work_dir, 'flights_history.xlsx')
+
+    def record(stage, start):
+        record_seconds(stage, time.perf_counter() - start)
+
+    def record_seconds(stage, seconds):
+        with timings_lock:
+            timings[stage].append(seconds)
+
+    # 每次合并写入工作簿的实际耗时
+    sink = HistorySink(excel_file, on_commit=lambda batches, seconds: record_seconds('commit', seconds))
+
+    def run_one(query):
+        dep_city, arr_city, dep_date, url = query
+
+        start = time.perf_counter()
+        if use_browser:
+            scraper = CTrip_FlightScraper(headless=True)
+            try:
+                page_source = scraper.fetch_page(url)
+            finally:
+                scraper.close()
+        else:
+            with urlopen(url) as resp:
+                page_source = resp.read().decode('utf-8')
+        record('fetch', start)
+        if not page_source:
+            return 0
+
+        start = time.perf_counter()
+        flights = parse_flights(page_source, direct_only=True)
+        record('parse', start)
+        if not flights:
+            return 0
+
+        start = time.perf_counter()
+        save_flights_to_file(flights, filename=os.path.join(
+            work_dir, f"flights_{dep_city}_{arr_city}_{dep_date}.json"))
+        record('json', start)
+        sink.submit(flights, city_name(dep_city), city_name(arr_city), dep_date)
+        return 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        done = sum(pool.map(run_one, queries))
+
+    # 等待最后一批合并写入完成
+    sink.close()
+
+    start = time.perf_counter()
+    generate_flight_charts(excel_file=excel_file,
+                           output_file=os.path.join(work_dir, 'flights_chart.html'),
+                           open_browser=False)
+    record('chart', start)
+    elapsed = time.perf_counter() - wall_start
+    return elapsed, timings, done
+
+
+def level_worker(queries, concurrency, use_browser, result_q):
+    """
+    子进程入口：跑一个并发度并回传结果和峰值内存
+    回传 (None, 结果) 或 (错误信息, None)，出错时也必须回传，否则父进程会一直等待
+    """
+    work_dir = tempfile.mkdtemp(prefix=f"bench_c{concurrency}_")
+    try:
+        elapsed, timings, done = run_level(queries, concurrency, work_dir, use_browser)
+    except Exception as e:
+        log_print(f"❌ 并发 {concurrency} 压测失败: {e}")
+        result_q.put((f"{type(e).__name__}: {e}", None))
+        return
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result_q.put((None, (elapsed, timings, done) + peak_rss()))
+
+
+def wait_result(worker, result_q, poll=1.0):
+    """等待子进程回传结果；子进程未回传就退出（如被系统杀死）时返回错误而不是一直阻塞"""
+    while True:
+        try:
+            return result_q.get(timeout=poll)
+        except queue.Empty:
+            if worker.is_alive():
+                continue
+        # 子进程可能在退出前刚好写入结果
+        try:
+            return result_q.get(timeout=poll)
+        except queue.Empty:
+            return f"子进程异常退出，退出码 {worker.exitcode}", None
+
+
+def format_mb(value):
+    return f"{value / 1024 / 1024:.0f} MB" if value else "N/A"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+# .venv\Scripts\python.exe bench.py --recordings recordings --levels 1,4,16 --queries 32
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="离线回放压测")
+    parser.add_argument("--recordings", default="recordings", help="query.py --record 录制的目录")
+    parser.add_argument("--levels", default="1,4,16", help="并发度列表，逗号分隔")
+    parser.add_argument("--queries", type=int, default=16, help="每个并发度执行的查询数")
+    parser.add_argument("--rate", type=float, default=0, help="回放页面速率上限（次/分钟），0 表示不限")
+    parser.add_argument("--latency", type=float, default=0.0, help="回放每个响应额外延迟（秒）")
+    parser.add_argument("--browser", action="store_true", default=False,
+                        help="用无头Chrome抓取（默认用HTTP直接获取页面，只测解析/保存/图表）")
+    args = parser.parse_args()
+
+    server, store = start_replay_server(args.recordings, rate=args.rate, latency=args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    recorded = replay_urls(store, base_url)
+    if not recorded:
+        log_print(f"❌ 目录 {args.recordings} 中没有录制数据，请先运行 query.py --record")
+        raise SystemExit(1)
+    queries = [recorded[i % len(recorded)] for i in range(args.queries)]
+
+    # spawn 保证每个子进程从干净的解释器开始，峰值RSS不包含父进程和其他并发度
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for level in [int(x) for x in args.levels.split(',') if x.strip()]:
+        result_q = ctx.Queue()
+        worker = ctx.Process(target=level_worker, args=(queries, level, args.browser, result_q))
+        worker.start()
+        error, result = wait_result(worker, result_q)
+        worker.join()
+        results.append((level, error, result))
+
+    server.shutdown()
+
+    log_print("=" * 100)
+    log_print(f"{'并发':<6} {'查询/分钟':<10} {'成功':<6} {'进程RSS':<10} {'子进程RSS':<10} 阶段耗时 p50 / p95 (毫秒)")
+    log_print("-" * 100)
+    for level, error, result in results:
+        if error:
+            log_print(f"{level:<6} 失败: {error}")
+            continue
+        elapsed, timings, done, rss_self, rss_children = result
+        stage_text = "  ".join(
+            f"{stage} {statistics.median(timings[stage]) * 1000:.0f}/{percentile(timings[stage], 0.95) * 1000:.0f}"
+            for stage in STAGES if timings[stage])
+        log_print(f"{level:<6} {done / elapsed * 60:<10.1f} {done:<6} {format_mb(rss_self):<10} "
+                  f"{format_mb(rss_children):<10} {stage_text}")
+    log_print("=" * 100)
+    if any(error for _, error, _ in results):
+        raise SystemExit(1)
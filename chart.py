@@ -1,128 +1,92 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pandas as pd
 import os
 import webbrowser
 import json
 from datetime import datetime
-from collections import defaultdict
+
+from analytics import refresh_summary, build_overview
+from history_reader import iter_history_rows, parse_query_time, parse_price, parse_flight_date
 
 def log_print(msg):
     timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
     print(f"{timestamp} {msg}")
 
-def generate_flight_charts():
-    excel_file = 'flights_history.xlsx'
+def collect_charts_data(excel_file):
+    """
+    Stream every sheet in read-only mode and fold rows into per-flight series.
+    Peak memory follows the number of chart points, not the size of the workbook.
+    """
+    # (flight_date, sheet_name) -> {'points': [(query_time, price)], 'dep_time', 'arr_time'}
+    flights = {}
+    sheet_names = set()
+    row_count = 0
+    
+    for sheet_name, _, row in iter_history_rows(excel_file, required=('查询时间', '价格(¥)')):
+        sheet_names.add(sheet_name)
+        query_time = parse_query_time(row.get('查询时间'))
+        price = parse_price(row.get('价格(¥)'))
+        flight_date = parse_flight_date(row.get('出发日期'), sheet_name) or '2026-01-01'
+        if query_time is None or price is None:
+            continue
+        
+        key = (flight_date, sheet_name)
+        flight = flights.get(key)
+        if flight is None:
+            # Departure and arrival times come from the first row of the sheet
+            dep_time = row.get('出发时间')
+            arr_time = row.get('到达时间')
+            flight = flights[key] = {
+                'points': [],
+                'dep_time': '' if dep_time in (None, 'N/A') else dep_time,
+                'arr_time': '' if arr_time in (None, 'N/A') else arr_time,
+            }
+        flight['points'].append((query_time, price))
+        row_count += 1
     
+    log_print(f"✅ 已读取 {len(sheet_names)} 个sheet共 {row_count} 条记录")
+    
+    # Convert to list for JSON serialization - each sheet gets its own chart
+    charts_data = []
+    for flight_date, sheet_name in sorted(flights, key=lambda k: k[0]):
+        flight = flights.pop((flight_date, sheet_name))
+        points = sorted(flight['points'], key=lambda p: p[0])
+        data_points = [{
+            'time': query_time.strftime('%H:%M:%S'),
+            'datetime': query_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'price': price
+        } for query_time, price in points]
+        
+        charts_data.append({
+            'name': sheet_name,
+            'date': flight_date,
+            'times': [p['time'] for p in data_points],
+            'prices': [p['price'] for p in data_points],
+            'data': data_points,
+            'dep_time': flight['dep_time'],
+            'arr_time': flight['arr_time']
+        })
+    
+    return charts_data
+
+def generate_flight_charts(excel_file='flights_history.xlsx', output_file='flights_chart.html', open_browser=True):
     if not os.path.exists(excel_file):
         log_print(f"❌ 文件 {excel_file} 不存在")
         return
     
     try:
-        xls = pd.ExcelFile(excel_file)
-        sheet_names = xls.sheet_names
-        
-        if not sheet_names:
-            log_print("❌ Excel文件中没有sheet")
-            return
-        
-        log_print(f"✅ 找到 {len(sheet_names)} 个sheet")
-        
-        # Organize data by departure date
-        date_data = defaultdict(lambda: defaultdict(list))
-        
-        for sheet_name in sheet_names:
-            try:
-                df = pd.read_excel(excel_file, sheet_name=sheet_name)
-                
-                if df.empty:
-                    log_print(f"⚠️ Sheet '{sheet_name}' 是空的，跳过")
-                    continue
-                
-                # Handle Chinese column names
-                query_col = '查询时间' if '查询时间' in df.columns else 'query_time'
-                price_col = '价格(¥)' if '价格(¥)' in df.columns else 'price'
-                date_col = '出发日期' if '出发日期' in df.columns else 'flight_date'
-                dep_time_col = '出发时间' if '出发时间' in df.columns else 'departure_time'
-                arr_time_col = '到达时间' if '到达时间' in df.columns else 'arrival_time'
-                
-                if query_col not in df.columns or price_col not in df.columns:
-                    log_print(f"⚠️ Sheet '{sheet_name}' 缺少必要的列，跳过")
-                    continue
-                
-                df['query_time'] = pd.to_datetime(df[query_col], errors='coerce')
-                df['price'] = pd.to_numeric(df[price_col], errors='coerce')
-                
-                # Extract departure and arrival times
-                dep_time = df[dep_time_col].iloc[0] if dep_time_col in df.columns and not df.empty else ''
-                arr_time = df[arr_time_col].iloc[0] if arr_time_col in df.columns and not df.empty else ''
-                
-                # Extract flight date
-                if date_col in df.columns:
-                    df['flight_date'] = pd.to_datetime(df[date_col], errors='coerce').dt.strftime('%Y-%m-%d')
-                else:
-                    import re
-                    match = re.search(r'(\d{4}-\d{2}-\d{2})', sheet_name)
-                    flight_date = match.group(1) if match else '2026-01-01'
-                    df['flight_date'] = flight_date
-                
-                df = df.dropna(subset=['query_time', 'price', 'flight_date'])
-                df = df.sort_values('query_time')
-                
-                if df.empty:
-                    log_print(f"⚠️ Sheet '{sheet_name}' 没有有效数据，跳过")
-                    continue
-                
-                # Group by flight date
-                for flight_date, group_df in df.groupby('flight_date'):
-                    data_points = []
-                    for idx, row in group_df.iterrows():
-                        data_points.append({
-                            'time': row['query_time'].strftime('%H:%M:%S'),
-                            'datetime': row['query_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                            'price': float(row['price'])
-                        })
-                    
-                    date_data[flight_date][sheet_name] = {
-                        'data': data_points,
-                        'dep_time': dep_time,
-                        'arr_time': arr_time
-                    }
-                
-                log_print(f"✅ 已处理sheet '{sheet_name}'")
-                
-            except Exception as e:
-                log_print(f"❌ 处理sheet '{sheet_name}' 时出错: {str(e)}")
-                continue
-        
-        # Convert to list for JSON serialization - each sheet gets its own chart
-        charts_data = []
-        for flight_date in sorted(date_data.keys()):
-            flights = date_data[flight_date]
-            
-            # Create a chart for each flight
-            for flight_name, flight_info in flights.items():
-                data_points = flight_info['data']
-                dep_time = flight_info['dep_time']
-                arr_time = flight_info['arr_time']
-                
-                if data_points:
-                    times = [p['time'] for p in data_points]
-                    prices = [p['price'] for p in data_points]
-                    
-                    charts_data.append({
-                        'name': flight_name,
-                        'date': flight_date,
-                        'times': times,
-                        'prices': prices,
-                        'data': data_points,
-                        'dep_time': dep_time,
-                        'arr_time': arr_time
-                    })
+        charts_data = collect_charts_data(excel_file)
         
         log_print(f"✅ 已组织 {len(charts_data)} 个航班的数据")
         
+        # Cross-flight overview from the incrementally refreshed summary
+        try:
+            overview = build_overview(refresh_summary(excel_file))
+        except Exception as e:
+            log_print(f"⚠️ 生成分析概览失败: {str(e)}")
+            overview = None
+        
         # Generate HTML with ECharts
         html_content = """<!DOCTYPE html>
 <html>
@@ -197,6 +161,37 @@ def generate_flight_charts():
             width: 100%;
             height: 240px;
         }
+        
+        .overview {
+            display: grid;
+            grid-template-columns: repeat(3, 1fr);
+            gap: 20px;
+            max-width: 1800px;
+            margin: 0 auto 30px;
+        }
+        
+        @media (max-width: 1400px) {
+            .overview {
+                grid-template-columns: 1fr;
+            }
+        }
+        
+        .overview table {
+            width: 100%;
+            border-collapse: collapse;
+            font-size: 13px;
+        }
+        
+        .overview th, .overview td {
+            padding: 6px 8px;
+            border-bottom: 1px solid #eee;
+            text-align: left;
+        }
+        
+        .overview th {
+            color: #7f8c8d;
+            font-weight: normal;
+        }
     </style>
 </head>
 <body>
@@ -204,6 +199,8 @@ def generate_flight_charts():
         <h1>✈️ 航班价格历史分析</h1>
     </div>
     
+    <div id="overview" class="overview"></div>
+    
     <div id="charts-container" class="charts-grid">
         <!-- Charts will be generated here -->
     </div>
@@ -211,6 +208,54 @@ def generate_flight_charts():
     <script>
         const chartsData = """ + json.dumps(charts_data) + """;
         
+        const overview = """ + json.dumps(overview, ensure_ascii=False) + """;
+        
+        function addOverviewTable(titleText, headers, rows) {
+            const panel = document.createElement('div');
+            panel.className = 'chart-container';
+            
+            const title = document.createElement('div');
+            title.className = 'chart-title';
+            title.textContent = titleText;
+            panel.appendChild(title);
+            
+            const table = document.createElement('table');
+            const headRow = table.insertRow();
+            headers.forEach(text => {
+                const th = document.createElement('th');
+                th.textContent = text;
+                headRow.appendChild(th);
+            });
+            rows.forEach(cells => {
+                const row = table.insertRow();
+                cells.forEach(text => {
+                    row.insertCell().textContent = text;
+                });
+            });
+            panel.appendChild(table);
+            document.getElementById('overview').appendChild(panel);
+        }
+        
+        function generateOverview() {
+            if (!overview) {
+                return;
+            }
+            addOverviewTable('📉 各出发日期最低价', ['航线', '出发日期', '最新最低价', '历史最低'],
+                overview.cheapest.map(item => [
+                    item.route, item.date,
+                    '¥' + item.price + ' ' + item.flight,
+                    '¥' + item.low_price + '（' + item.low_day + '）'
+                ]));
+            addOverviewTable('🔻 降价最频繁的航班', ['航班', '降价次数', '价格变化', '降价占比'],
+                overview.drops.map(item => [
+                    item.flight, item.drops, item.changes, (item.rate * 100).toFixed(0) + '%'
+                ]));
+            addOverviewTable('🗓️ 最佳提前购买时间', ['航线', '提前天数', '平均价格', '样本数'],
+                overview.best_lead.map(item => [
+                    item.route, item.days_from + '-' + item.days_to + ' 天', '¥' + item.avg_price, item.samples
+                ]));
+        }
+        
         function generateCharts() {
             const container = document.getElementById('charts-container');
             
@@ -375,19 +420,20 @@ def generate_flight_charts():
         
         // Initialize when page loads
         window.addEventListener('load', generateCharts);
+        window.addEventListener('load', generateOverview);
     </script>
 </body>
 </html>
 """
         
-        output_file = 'flights_chart.html'
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write(html_content)
         
         log_print(f"✅ HTML文件已生成: {output_file}")
         
-        webbrowser.open(os.path.abspath(output_file))
-        log_print(f"✅ 正在打开HTML文件...")
+        if open_browser:
+            webbrowser.open(os.path.abspath(output_file))
+            log_print(f"✅ 正在打开HTML文件...")
         
     except Exception as e:
         log_print(f"❌ 错误: {str(e)}")
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地图表服务：页面只加载航班索引，图表进入可见区域时才请求对应航班的数据；
+所有接口带 ETag，数据未变化时返回 304，新查询写入后页面只拉取新增的价格点。
+
+接口：
+    /                         轻量页面
+    /api/flights              航班索引（名称、日期、点数、最新价格）
+    /api/flights/<id>         单个航班的价格序列，?since=N&token=T 只返回第 N 个点之后的数据
+    /api/dates                出发日期列表
+    /api/dates/<date>         某个出发日期所有航班的价格序列
+    /api/overview             跨航班分析概览
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import webbrowser
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+from chart import collect_charts_data
+from analytics import refresh_summary, build_overview
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+def series_token(data):
+    """价格点序列的指纹，用于确认客户端已有的前 N 个点与当前序列一致"""
+    digest = hashlib.sha1()
+    for p in data:
+        digest.update(f"{p['datetime']}|{p['price']}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def flight_series(chart, since=0, token=None):
+    """
+    把 collect_charts_data 的单个航班转换为接口返回的序列
+    序列按查询时间排序，暂存结果合并后较早的点会插入到中间；
+    客户端已有的前 since 个点与 token 不一致时返回完整序列（since 为 0），客户端据此整体替换
+    """
+    if since and (since > len(chart['data']) or series_token(chart['data'][:since]) != token):
+        since = 0
+    data = chart['data'][since:]
+    return {
+        'id': quote(chart['name'], safe=''),
+        'name': chart['name'],
+        'date': chart['date'],
+        'dep_time': chart['dep_time'],
+        'arr_time': chart['arr_time'],
+        'since': since,
+        'total': len(chart['data']),
+        'token': series_token(chart['data']),
+        'times': [p['time'] for p in data],
+        'datetimes': [p['datetime'] for p in data],
+        'prices': [p['price'] for p in data],
+    }
+
+
+class ChartStore:
+    """
+    内存缓存：历史文件的修改时间或大小变化时重新读取，
+    每个接口的响应体和 ETag 只在第一次请求时生成
+    """
+
+    def __init__(self, excel_file):
+        self.excel_file = excel_file
+        self.version = None
+        self.charts = {}      # 航班名 -> collect_charts_data 中的条目
+        self.responses = {}   # 缓存键 -> (响应体, ETag)
+        self.lock = threading.Lock()
+
+    def _current_version(self):
+        try:
+            st = os.stat(self.excel_file)
+        except OSError:
+            return None
+        return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+    def _refresh(self):
+        version = self._current_version()
+        if version == self.version:
+            return
+        charts = collect_charts_data(self.excel_file) if version else []
+        self.charts = {chart['name']: chart for chart in charts}
+        self.responses = {}
+        self.version = version
+        log_print(f"✅ 已加载 {len(self.charts)} 个航班的数据")
+
+    def response(self, key, build):
+        """
+        返回 (响应体, ETag)；build 返回 None 表示资源不存在
+        """
+        with self.lock:
+            self._refresh()
+            if key not in self.responses:
+                payload = build()
+                if payload is None:
+                    return None, None
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+                self.responses[key] = (body, etag)
+            return self.responses[key]
+
+    def flights_index(self):
+        flights = []
+        for chart in sorted(self.charts.values(), key=lambda c: c['date']):
+            last = chart['data'][-1] if chart['data'] else {}
+            flights.append({
+                'id': quote(chart['name'], safe=''),
+                'name': chart['name'],
+                'date': chart['date'],
+                'dep_time': chart['dep_time'],
+                'arr_time': chart['arr_time'],
+                'points': len(chart['data']),
+                'last_price': last.get('price'),
+                'last_datetime': last.get('datetime'),
+            })
+        return {'version': self.version, 'flights': flights}
+
+    def flight(self, name, since, token):
+        chart = self.charts.get(name)
+        return flight_series(chart, since, token) if chart else None
+
+    def dates(self):
+        return sorted({chart['date'] for chart in self.charts.values()})
+
+    def date_series(self, date):
+        series = [flight_series(c) for c in self.charts.values() if c['date'] == date]
+        return series or None
+
+    def overview(self):
+        return build_overview(refresh_summary(self.excel_file)) if self.version else None
+
+
+def make_handler(store):
+    class ChartHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            parts = [unquote(p) for p in parsed.path.strip('/').split('/') if p]
+            query = parse_qs(parsed.query)
+
+            if not parts:
+                self.send_body(INDEX_HTML.encode('utf-8'), 'text/html; charset=utf-8')
+                return
+
+            if parts[0] != 'api' or len(parts) < 2:
+                self.send_error(404)
+                return
+
+            try:
+                since = max(int(query.get('since', ['0'])[0]), 0)
+            except ValueError:
+                since = 0
+            token = query.get('token', [''])[0]
+
+            if parts[1:] == ['flights']:
+                body, etag = store.response('flights', store.flights_index)
+            elif parts[1] == 'flights' and len(parts) == 3:
+                body, etag = store.response(('flight', parts[2], since, token),
+                                            lambda: store.flight(parts[2], since, token))
+            elif parts[1:] == ['dates']:
+                body, etag = store.response('dates', store.dates)
+            elif parts[1] == 'dates' and len(parts) == 3:
+                body, etag = store.response(('date', parts[2]), lambda: store.date_series(parts[2]))
+            elif parts[1:] == ['overview']:
+                body, etag = store.response('overview', store.overview)
+            else:
+                body, etag = None, None
+
+            if body is None:
+                self.send_error(404)
+                return
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_body(body, 'application/json; charset=utf-8', etag)
+
+        def send_body(self, body, content_type, etag=None):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            # 浏览器每次都向服务器确认，数据未变时得到 304
+            self.send_header('Cache-Control', 'no-cache')
+            if etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChartHandler
+
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>航班价格历史分析</title>
+    <script src="https://cdn.jsdelivr.net/npm/echarts@5.4.0/dist/echarts.min.js"></script>
+    <style>
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        body { font-family: 'Microsoft YaHei', Arial, sans-serif; background-color: #f5f5f5; padding: 20px; }
+        .header { background-color: #2c3e50; color: white; padding: 20px; text-align: center; border-radius: 8px; margin-bottom: 30px; }
+        .header h1 { font-size: 28px; margin-bottom: 5px; }
+        .header .status { font-size: 12px; color: #bdc3c7; }
+        .grid { display: grid; grid-template-columns: repeat(3, 1fr); gap: 20px; max-width: 1800px; margin: 0 auto 30px; }
+        @media (max-width: 1400px) { .grid { grid-template-columns: repeat(2, 1fr); } }
+        @media (max-width: 900px) { .grid { grid-template-columns: 1fr; } }
+        .panel { background-color: white; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1); padding: 20px; }
+        .chart-title { font-size: 16px; font-weight: bold; color: #2c3e50; margin-bottom: 15px; padding-bottom: 10px; border-bottom: 2px solid #3498db; }
+        .chart { width: 100%; height: 240px; }
+        table { width: 100%; border-collapse: collapse; font-size: 13px; }
+        th, td { padding: 6px 8px; border-bottom: 1px solid #eee; text-align: left; }
+        th { color: #7f8c8d; font-weight: normal; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>✈️ 航班价格历史分析</h1>
+        <div class="status" id="status"></div>
+    </div>
+    <div id="overview" class="grid"></div>
+    <div id="charts" class="grid"></div>
+
+    <script>
+        const POLL_MS = 60000;
+        const etags = {};
+        const charts = {};  // id -> {chart, loaded, total, times, datetimes, prices}
+
+        // 带 ETag 的请求：数据未变化时返回 null
+        async function fetchJson(url) {
+            const headers = etags[url] ? {'If-None-Match': etags[url]} : {};
+            const resp = await fetch(url, {headers});
+            if (resp.status === 304) {
+                return null;
+            }
+            if (!resp.ok) {
+                throw new Error(url + ' ' + resp.status);
+            }
+            etags[url] = resp.headers.get('ETag');
+            return resp.json();
+        }
+
+        function addTable(titleText, headers, rows) {
+            const panel = document.createElement('div');
+            panel.className = 'panel';
+            const title = document.createElement('div');
+            title.className = 'chart-title';
+            title.textContent = titleText;
+            panel.appendChild(title);
+            const table = document.createElement('table');
+            const headRow = table.insertRow();
+            headers.forEach(text => {
+                const th = document.createElement('th');
+                th.textContent = text;
+                headRow.appendChild(th);
+            });
+            rows.forEach(cells => {
+                const row = table.insertRow();
+                cells.forEach(text => { row.insertCell().textContent = text; });
+            });
+            panel.appendChild(table);
+            document.getElementById('overview').appendChild(panel);
+        }
+
+        async function loadOverview() {
+            const overview = await fetchJson('/api/overview');
+            if (!overview) {
+                return;
+            }
+            document.getElementById('overview').innerHTML = '';
+            addTable('📉 各出发日期最低价', ['航线', '出发日期', '最新最低价', '历史最低'],
+                overview.cheapest.map(item => [item.route, item.date,
+                    '¥' + item.price + ' ' + item.flight, '¥' + item.low_price + '（' + item.low_day + '）']));
+            addTable('🔻 降价最频繁的航班', ['航班', '降价次数', '价格变化', '降价占比'],
+                overview.drops.map(item => [item.flight, item.drops, item.changes, (item.rate * 100).toFixed(0) + '%']));
+            addTable('🗓️ 最佳提前购买时间', ['航线', '提前天数', '平均价格', '样本数'],
+                overview.best_lead.map(item => [item.route, item.days_from + '-' + item.days_to + ' 天',
+                    '¥' + item.avg_price, item.samples]));
+        }
+
+        function renderChart(state) {
+            state.chart.setOption({
+                tooltip: {
+                    trigger: 'axis',
+                    formatter: params => state.datetimes[params[0].dataIndex] + '<br/>' + params[0].value + ' 元'
+                },
+                grid: { left: '5%', right: '5%', bottom: '10%', top: '15%', containLabel: true },
+                toolbox: { feature: { saveAsImage: { pixelRatio: 2 }, dataZoom: {}, restore: {} }, top: 10, right: 20 },
+                xAxis: { type: 'category', boundaryGap: false, data: state.times, axisLabel: { fontSize: 11 } },
+                yAxis: {
+                    type: 'value', name: '价格 (元)', scale: true,
+                    min: value => Math.floor(value.min * 0.95),
+                    max: value => Math.ceil(value.max * 1.02),
+                    axisLabel: { fontSize: 11 }
+                },
+                series: [{ type: 'line', data: state.prices, smooth: true, symbol: 'circle', symbolSize: 6 }]
+            });
+        }
+
+        // 图表可见时才请求数据；之后只请求新增的点
+        async function loadSeries(id) {
+            const state = charts[id];
+            const url = '/api/flights/' + id +
+                (state.loaded ? '?since=' + state.total + '&token=' + state.token : '');
+            const series = await fetchJson(url);
+            if (!series) {
+                return;
+            }
+            if (series.since === 0) {
+                // 服务端返回完整序列（首次加载，或已有的点与当前序列不一致）
+                state.times = [];
+                state.datetimes = [];
+                state.prices = [];
+            }
+            state.times.push(...series.times);
+            state.datetimes.push(...series.datetimes);
+            state.prices.push(...series.prices);
+            state.total = series.total;
+            state.token = series.token;
+            state.loaded = true;
+            renderChart(state);
+        }
+
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    loadSeries(entry.target.dataset.id);
+                }
+            });
+        }, { rootMargin: '200px' });
+
+        function addChart(flight) {
+            const panel = document.createElement('div');
+            panel.className = 'panel';
+            const title = document.createElement('div');
+            title.className = 'chart-title';
+            title.textContent = flight.name + (flight.dep_time && flight.arr_time ? '  ' + flight.dep_time + ' → ' + flight.arr_time : '');
+            panel.appendChild(title);
+            const chartElem = document.createElement('div');
+            chartElem.className = 'chart';
+            chartElem.dataset.id = flight.id;
+            panel.appendChild(chartElem);
+            document.getElementById('charts').appendChild(panel);
+
+            charts[flight.id] = {
+                chart: echarts.init(chartElem), loaded: false, total: 0, token: '',
+                times: [], datetimes: [], prices: []
+            };
+            observer.observe(chartElem);
+        }
+
+        async function loadIndex() {
+            const index = await fetchJson('/api/flights');
+            if (!index) {
+                return false;
+            }
+            index.flights.forEach(flight => {
+                const state = charts[flight.id];
+                if (!state) {
+                    addChart(flight);
+                } else if (state.loaded && flight.points > state.total) {
+                    loadSeries(flight.id);
+                }
+            });
+            document.getElementById('status').textContent =
+                index.flights.length + ' 个航班 · 更新于 ' + new Date().toLocaleTimeString();
+            return true;
+        }
+
+        async function poll() {
+            try {
+                if (await loadIndex()) {
+                    await loadOverview();
+                }
+            } catch (e) {
+                document.getElementById('status').textContent = '⚠ ' + e.message;
+            }
+        }
+
+        window.addEventListener('resize', () => Object.values(charts).forEach(s => s.chart.resize()));
+        window.addEventListener('load', () => {
+            poll();
+            setInterval(poll, POLL_MS);
+        });
+    </script>
+</body>
+</html>
+"""
+
+
+# .venv\Scripts\python.exe chart_server.py
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地航班价格图表服务")
+    parser.add_argument("--history", default="flights_history.xlsx", help="历史记录Excel文件")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--no-browser", dest="open_browser", action="store_false", default=True,
+                        help="启动后不自动打开浏览器")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(ChartStore(args.history)))
+    server.daemon_threads = True
+    url = f"http://{args.host}:{server.server_address[1]}/"
+    log_print(f"✅ 图表服务已启动: {url}")
+    if args.open_browser:
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        log_print("图表服务已停止")
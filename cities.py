@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+城市代码与中文名映射，不依赖浏览器等第三方库，供查询、调度、提醒等模块共用。
+添加新城市时只需修改 CITY_LABELS。
+"""
+
+CITY_LABELS = {
+    'hgh': '杭州',
+    'sha': '上海',
+    'pek': '北京',
+    'can': '广州',
+    'szx': '深圳',
+    'ctu': '成都',
+    'akl': '奥克兰',
+    'syd': '悉尼',
+    'mel': '墨尔本',
+}
+
+
+def city_name(code: str) -> str:
+    return CITY_LABELS.get(code.lower(), code.upper())
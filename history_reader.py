@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式读取历史记录：以 openpyxl 只读模式逐行遍历 flights_history.xlsx，
+调用方边读边聚合，内存占用与输出大小相关，而不是与历史总量相关。
+"""
+
+import re
+from datetime import date, datetime
+
+from openpyxl import load_workbook
+from openpyxl.utils.datetime import from_excel
+
+# 兼容旧版英文列名
+COLUMN_ALIASES = {
+    'query_time': '查询时间',
+    'flight_date': '出发日期',
+    'departure_time': '出发时间',
+    'arrival_time': '到达时间',
+    'price': '价格(¥)',
+}
+
+# 常见的查询时间格式，逐个尝试比交给 pandas 解析快得多
+QUERY_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S",
+                      "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d")
+
+
+def iter_history_rows(filename, required=(), start_rows=None):
+    """
+    逐行读取所有 sheet
+    :param required: 必须存在的列，缺少时跳过该 sheet
+    :param start_rows: {sheet: 已处理的数据行数}，只读取之后的行
+    :return: 生成 (sheet名, 数据行号, {列名: 值})，数据行号从 1 开始（不含表头）
+    """
+    start_rows = start_rows or {}
+    wb = load_workbook(filename, read_only=True)
+    try:
+        for ws in wb.worksheets:
+            header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+            if not header:
+                continue
+            columns = [COLUMN_ALIASES.get(name, name) for name in header]
+            if any(name not in columns for name in required):
+                continue
+
+            done = start_rows.get(ws.title, 0)
+            for row_no, values in enumerate(ws.iter_rows(min_row=done + 2, values_only=True), done + 1):
+                if all(v is None for v in values):
+                    continue
+                yield ws.title, row_no, dict(zip(columns, values))
+    finally:
+        wb.close()
+
+
+def parse_query_time(value):
+    """
+    查询时间可能是字符串、Excel 日期或日期序列号
+    常见格式直接解析，其他写法（手工编辑、旧版本导出等）交给 pandas 宽松解析，无法识别时返回 None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, (int, float)):
+        try:
+            return from_excel(value)
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    text = str(value).strip()
+    if not text:
+        return None
+    for fmt in QUERY_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        import pandas as pd
+        parsed = pd.to_datetime(text, errors='coerce')
+        if pd.isna(parsed):
+            return None
+        parsed = parsed.to_pydatetime()
+    # 与写入时的本地时间保持一致，去掉时区便于比较
+    return parsed.replace(tzinfo=None)
+
+
+def parse_price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_flight_date(value, sheet_name=''):
+    """出发日期统一为 YYYY-MM-DD；其他写法宽松解析，仍无法识别时从 sheet 名称中提取"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if value:
+        match = re.search(r'(\d{4}-\d{2}-\d{2})', str(value))
+        if match:
+            return match.group(1)
+        parsed = parse_query_time(value)
+        if parsed:
+            return parsed.strftime('%Y-%m-%d')
+    match = re.search(r'(\d{4}-\d{2}-\d{2})', sheet_name)
+    return match.group(1) if match else None
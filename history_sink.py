@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录写入：所有对 flights_history.xlsx 的写入都经过这里。
+- 文件锁保证多个 query.py 进程不会同时读改写同一个工作簿而丢失数据
+- HistorySink 在进程内把并发查询的结果排队，每个时间间隔合并为一次写入
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, Alignment
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+HEADERS = ['查询时间', '出发城市', '目的地', '出发日期', '航空公司', '航班号',
+           '出发时间', '到达时间', '飞行时长', '价格(¥)']
+
+SAVE_RETRIES = 5      # Windows 上工作簿被其他程序打开时替换会失败，退避重试次数
+SAVE_BACKOFF = 0.5    # 首次重试等待秒数，之后每次翻倍
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+class FileLock:
+    """
+    跨进程文件锁（锁文件为 {path}.lock），进程退出时系统自动释放
+    用法：with FileLock('flights_history.xlsx'): ...
+    """
+
+    def __init__(self, path, timeout=120, poll=0.2):
+        self.lock_path = path + '.lock'
+        self.timeout = timeout
+        self.poll = poll
+        self.fd = None
+
+    def acquire(self):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.fd = fd
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"等待文件锁超时: {self.lock_path}")
+                time.sleep(self.poll)
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if os.name == 'nt':
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def sheet_name_for(dep_city_label, arr_city_label, dep_date, flight):
+    """
+    航班所在的sheet名称：城市对_日期_航空公司_航班号，超过31个字符时去掉日期并截断
+    同时作为提醒统计、分析汇总和图表中的航班标识
+    """
+    airline = flight.get('airline', '未知航空').replace('航空', '')
+    flight_no = flight.get('flight_number', 'N/A')
+
+    # 生成sheet名称：城市对_日期_航空公司_航班号
+    sheet_name = f"{dep_city_label}-{arr_city_label}_{dep_date}_{airline}_{flight_no}"
+
+    # Excel sheet名称长度限制为31个字符
+    if len(sheet_name) > 31:
+        sheet_name = f"{dep_city_label}-{arr_city_label}_{airline}_{flight_no}"[:31]
+    return sheet_name
+
+
+def append_flights_to_workbook(wb, batch):
+    """
+    把一次查询的结果追加到工作簿（每个航班单独一个sheet：城市对_日期_航空公司_航班号）
+    :param batch: (查询时间, 出发城市名, 目的地名, 出发日期, 航班列表)
+    :return: 本次写入的sheet
+    """
+    query_time, dep_city_label, arr_city_label, dep_date, flights = batch
+    touched = []
+    for flight in flights:
+        flight_no = flight.get('flight_number', 'N/A')
+        sheet_name = sheet_name_for(dep_city_label, arr_city_label, dep_date, flight)
+
+        # 检查sheet是否存在
+        if sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+        else:
+            ws = wb.create_sheet(sheet_name)
+
+            # 创建表头
+            ws.append(HEADERS)
+
+            # 设置表头样式
+            for cell in ws[1]:
+                cell.font = Font(bold=True)
+                cell.alignment = Alignment(horizontal='center')
+
+        # 添加数据行
+        ws.append([
+            query_time,
+            dep_city_label,
+            arr_city_label,
+            dep_date,
+            flight.get('airline', 'N/A'),
+            flight_no,
+            flight.get('departure_time', 'N/A'),
+            flight.get('arrival_time', 'N/A'),
+            flight.get('duration', 'N/A'),
+            flight.get('price', 'N/A')
+        ])
+        touched.append(ws)
+    return touched
+
+
+def autosize_columns(ws):
+    """自动调整列宽"""
+    for column in ws.columns:
+        max_length = 0
+        column_letter = column[0].column_letter
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
+
+
+def spool_path(filename):
+    """写入失败时暂存查询结果的文件"""
+    return filename + '.pending.jsonl'
+
+
+def spool_batches(batches, filename='flights_history.xlsx'):
+    """把未能写入工作簿的查询结果追加到暂存文件，下次 write_batches 成功时合并"""
+    path = spool_path(filename)
+    with FileLock(path):
+        with open(path, 'a', encoding='utf-8') as f:
+            for batch in batches:
+                f.write(json.dumps(list(batch), ensure_ascii=False) + '\n')
+
+
+def load_spool(path):
+    batches = []
+    if not os.path.exists(path):
+        return batches
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                batches.append(tuple(json.loads(line)))
+    return batches
+
+
+def save_workbook(wb, filename):
+    """
+    先写临时文件再替换，避免中途失败损坏历史记录
+    Windows 上读取方（Excel、chart.py 等）打开工作簿时保存或替换会抛 PermissionError，
+    调用方持有文件锁，这里退避重试，最终失败时清理临时文件并抛出
+    """
+    tmp_file = filename + '.tmp'
+    for attempt in range(SAVE_RETRIES):
+        try:
+            wb.save(tmp_file)
+            os.replace(tmp_file, filename)
+            return
+        except PermissionError as e:
+            if attempt == SAVE_RETRIES - 1:
+                if os.path.exists(tmp_file):
+                    try:
+                        os.remove(tmp_file)
+                    except OSError:
+                        pass
+                raise
+            delay = SAVE_BACKOFF * 2 ** attempt
+            log_print(f"⚠ {filename} 被占用，{delay:.1f} 秒后重试: {e}")
+            time.sleep(delay)
+
+
+def write_batches(batches, filename='flights_history.xlsx', on_merged=None):
+    """
+    在文件锁内把多次查询的结果一次性写入工作簿（读取、追加、保存各一次）
+    之前写入失败暂存的结果会一并写入，成功后清空暂存文件
+    :param batches: [(查询时间, 出发城市名, 目的地名, 出发日期, 航班列表)]
+    :param on_merged: 暂存结果合并写入成功后调用 on_merged(暂存的查询结果)，每条暂存结果只会回调一次
+    :return: 写入的行数
+    """
+    pending_file = spool_path(filename)
+    with FileLock(filename), FileLock(pending_file):
+        # 必须在持锁后读取，才能看到其他进程刚写入的数据
+        if os.path.exists(filename):
+            wb = load_workbook(filename)
+        else:
+            wb = Workbook()
+            # 删除默认的Sheet
+            if 'Sheet' in wb.sheetnames:
+                wb.remove(wb['Sheet'])
+
+        spooled = load_spool(pending_file)
+        if spooled:
+            log_print(f"✓ 合并 {len(spooled)} 次暂存的查询结果")
+
+        touched = {}
+        rows = 0
+        for batch in spooled + list(batches):
+            for ws in append_flights_to_workbook(wb, batch):
+                touched[ws.title] = ws
+                rows += 1
+        # 每个sheet每次提交只调整一次列宽
+        for ws in touched.values():
+            autosize_columns(ws)
+
+        save_workbook(wb, filename)
+        if spooled:
+            os.remove(pending_file)
+    if spooled and on_merged:
+        on_merged(spooled)
+    return rows
+
+
+class HistorySink:
+    """
+    进程内的单一写入者：submit() 只是入队，后台线程每隔 interval 秒把队列中的
+    所有结果合并为一次 write_batches，供并发抓取（pipeline.py、bench.py）使用
+    :param on_commit: 每次成功写入后调用 on_commit(batches, 耗时秒数)，batches 包含一并合并的暂存结果
+    """
+
+    def __init__(self, filename='flights_history.xlsx', interval=2.0, on_commit=None):
+        self.filename = filename
+        self.interval = interval
+        self.on_commit = on_commit
+        self.queue = queue.Queue()
+        self.pending = []
+        self.commits = 0
+        self.rows = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, flights, dep_city_label, arr_city_label, dep_date, query_time=None):
+        query_time = query_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.queue.put((query_time, dep_city_label, arr_city_label, dep_date, flights))
+
+    def _drain(self):
+        while True:
+            try:
+                self.pending.append(self.queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def _commit(self):
+        self._drain()
+        if not self.pending:
+            return
+        start = time.perf_counter()
+        try:
+            merged = []
+            rows = write_batches(self.pending, self.filename, on_merged=merged.extend)
+        except Exception as e:
+            # 保留未写入的数据，下个周期重试
+            log_print(f"❌ 写入 {self.filename} 失败，稍后重试: {e}")
+            return
+        seconds = time.perf_counter() - start
+        log_print(f"✓ 已合并写入 {len(self.pending)} 次查询共 {rows} 条记录到 {self.filename}")
+        self.commits += 1
+        self.rows += rows
+        batches, self.pending = merged + self.pending, []
+        if self.on_commit:
+            try:
+                self.on_commit(batches, seconds)
+            except Exception as e:
+                log_print(f"⚠ 写入后回调失败: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # 等到第一条数据后再攒一个周期，合并同时到达的结果
+                # 有上次写入失败的数据时，即使没有新数据也每个周期重试一次
+                self.pending.append(self.queue.get(timeout=self.interval if self.pending else 0.5))
+            except queue.Empty:
+                if not self.pending:
+                    continue
+            else:
+                self._stop.wait(self.interval)
+            self._commit()
+
+    def close(self):
+        """停止后台线程并写入剩余数据，仍然失败的结果暂存到 {filename}.pending.jsonl"""
+        self._stop.set()
+        self._thread.join()
+        self._commit()
+        if self.pending:
+            try:
+                spool_batches(self.pending, self.filename)
+                log_print(f"⚠ {len(self.pending)} 次查询结果未能写入，已暂存到 {spool_path(self.filename)}")
+                self.pending = []
+            except Exception as e:
+                log_print(f"❌ 仍有 {len(self.pending)} 次查询结果未能写入 {self.filename}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线批量查询：抓取 → 解析 → 保存 三个阶段分别在独立线程中运行，阶段之间用有界队列连接。
+浏览器加载第 N+1 个页面的同时解析并保存第 N 个结果，整体吞吐由最慢的阶段决定。
+"""
+
+import argparse
+import json
+import queue
+import threading
+from datetime import datetime
+
+from cities import city_name
+from query import (CTrip_FlightScraper, build_url, display_flights,
+                   parse_flights, save_flights_to_file, CTRIP_BASE_URL)
+from history_sink import HistorySink
+from alerts import load_alert_engine
+
+_DONE = object()  # 阶段结束标记
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+def normalize_query(q):
+    """
+    城市代码去空白并转小写（与 query.py 一致），缺少 from / to / date 时返回 None
+    :param q: config.json 中的查询，如 {"from": "SHA", "to": "akl", "date": "2026-09-25"}
+    """
+    if not isinstance(q, dict):
+        return None
+    dep_city = str(q.get('from') or '').strip().lower()
+    arr_city = str(q.get('to') or '').strip().lower()
+    dep_date = str(q.get('date') or '').strip()
+    if not (dep_city and arr_city and dep_date):
+        return None
+    return {'from': dep_city, 'to': arr_city, 'date': dep_date}
+
+
+def parse_query_spec(spec):
+    """解析 from:to:date 格式的查询，如 sha:akl:2026-09-25，格式不对时返回 None"""
+    parts = spec.split(':')
+    if len(parts) != 3:
+        return None
+    return normalize_query(dict(zip(('from', 'to', 'date'), parts)))
+
+
+def fetch_stage(queries, out_q, headless, debug, base_url):
+    """抓取阶段：复用同一个浏览器依次加载页面"""
+    scraper = None
+    try:
+        for q in queries:
+            url = build_url(dep_city=q['from'], arr_city=q['to'], dep_date=q['date'], base_url=base_url)
+            try:
+                if scraper is None:
+                    scraper = CTrip_FlightScraper(headless=headless, debug=debug)
+                page_source = scraper.fetch_page(url)
+            except Exception as e:
+                log_print(f"❌ 抓取 {q['from']}→{q['to']} {q['date']} 失败: {e}")
+                # 浏览器可能已失效，下一个查询重新启动
+                if scraper is not None:
+                    scraper.close()
+                    scraper = None
+                continue
+            if page_source is not None:
+                out_q.put((q, page_source))
+    finally:
+        if scraper is not None:
+            scraper.close()
+        out_q.put(_DONE)
+
+
+def parse_stage(in_q, out_q, debug):
+    """解析阶段"""
+    while True:
+        item = in_q.get()
+        if item is _DONE:
+            out_q.put(_DONE)
+            return
+        q, page_source = item
+        try:
+            flights = parse_flights(page_source, direct_only=True, debug=debug)
+        except Exception as e:
+            log_print(f"❌ 解析 {q['from']}→{q['to']} {q['date']} 失败: {e}")
+            continue
+        out_q.put((q, flights))
+
+
+def persist_stage(in_q, sink):
+    """保存阶段：打印结果、写JSON快照、提交到历史记录写入器"""
+    while True:
+        item = in_q.get()
+        if item is _DONE:
+            return
+        q, flights = item
+        try:
+            display_flights(flights, dep_date=q['date'], dep_city_code=q['from'], arr_city_code=q['to'])
+            if flights:
+                save_flights_to_file(flights, filename=f"flights_{q['from']}_{q['to']}_{q['date']}.json")
+                sink.submit(flights, city_name(q['from']), city_name(q['to']), q['date'])
+            else:
+                log_print(f"⚠ {q['from']}→{q['to']} {q['date']} 未保存任何航班信息")
+        except Exception as e:
+            log_print(f"❌ 保存 {q['from']}→{q['to']} {q['date']} 失败: {e}")
+
+
+def make_alert_callback(alert_engine):
+    """HistorySink 写入成功后再评估价格提醒，未写入的结果不会触发提醒或进入统计"""
+    def on_commit(batches, seconds):
+        for query_time, dep_city_label, arr_city_label, dep_date, flights in batches:
+            try:
+                alert_engine.observe(flights, dep_city_label, arr_city_label, dep_date, query_time)
+            except Exception as e:
+                log_print(f"⚠ 评估 {dep_city_label}→{arr_city_label} {dep_date} 价格提醒失败: {e}")
+    return on_commit
+
+
+def run_pipeline(queries, headless=True, debug=False, base_url=CTRIP_BASE_URL,
+                 excel_file='flights_history.xlsx', queue_size=2, alert_engine=None):
+    """
+    以流水线方式执行一批查询
+    :param queue_size: 阶段之间的队列容量，防止抓取远快于保存时页面堆积在内存中
+    """
+    parse_q = queue.Queue(maxsize=queue_size)
+    persist_q = queue.Queue(maxsize=queue_size)
+
+    on_commit = make_alert_callback(alert_engine) if alert_engine else None
+    with HistorySink(excel_file, on_commit=on_commit) as sink:
+        threads = [
+            threading.Thread(target=fetch_stage, args=(queries, parse_q, headless, debug, base_url), name='fetch'),
+            threading.Thread(target=parse_stage, args=(parse_q, persist_q, debug), name='parse'),
+            threading.Thread(target=persist_stage, args=(persist_q, sink), name='persist'),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+# .venv\Scripts\python.exe pipeline.py --query sha:akl:2026-09-24 --query sha:akl:2026-09-25
+# .venv\Scripts\python.exe pipeline.py --config config.json
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="流水线批量查询直飞航班")
+    parser.add_argument("--query", dest="queries", action="append", default=[],
+                        help="查询，格式 from:to:date，可重复指定")
+    parser.add_argument("--config", default=None, help="从配置文件读取全部查询")
+    parser.add_argument("--headless", dest="headless", action="store_true", default=True,
+                        help="启用无头模式，默认开启")
+    parser.add_argument("--no-headless", dest="headless", action="store_false",
+                        help="关闭无头模式，显示浏览器窗口")
+    parser.add_argument("--debug", action="store_true", default=False,
+                        help="保存调试页面源码")
+    parser.add_argument("--base-url", dest="base_url", default=CTRIP_BASE_URL,
+                        help="查询站点地址，可指向 replay.py 启动的本地回放服务")
+    args = parser.parse_args()
+
+    candidates = [(spec, parse_query_spec(spec)) for spec in args.queries]
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            candidates += [(q, normalize_query(q)) for q in json.load(f).get('queries', [])]
+    queries = []
+    for raw, q in candidates:
+        if q is None:
+            log_print(f"⚠ 跳过无效查询: {raw}")
+        else:
+            queries.append(q)
+    if not queries:
+        parser.error("请通过 --query 或 --config 指定查询")
+
+    log_print(f"✅ 流水线开始执行 {len(queries)} 个查询")
+    run_pipeline(queries, headless=args.headless, debug=args.debug, base_url=args.base_url,
+                 alert_engine=load_alert_engine())
+    log_print("✅ 流水线执行完毕")
@@ -12,23 +12,15 @@ import time
 import json
 import re
 from datetime import datetime
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Alignment
 import os
 import subprocess
 import sys
+from urllib.parse import urlparse, parse_qs
+from cities import CITY_LABELS, city_name
+from history_sink import write_batches, spool_batches, spool_path
+from alerts import load_alert_engine
 
-CITY_LABELS = {
-    'hgh': '杭州',
-    'sha': '上海',
-    'pek': '北京',
-    'can': '广州',
-    'szx': '深圳',
-    'ctu': '成都',
-    'akl': '奥克兰',
-    'syd': '悉尼',
-    'mel': '墨尔本',
-}
+CTRIP_BASE_URL = "https://flights.ctrip.com"
 
 def log_print(msg):
     """带时间戳的打印函数"""
@@ -36,7 +28,7 @@ def log_print(msg):
     print(f"{timestamp} {msg}")
 
 class CTrip_FlightScraper:
-    def __init__(self, headless=True, debug=False):
+    def __init__(self, headless=True, debug=False, record_dir=None):
         # 初始化浏览器
         options = webdriver.ChromeOptions()
         
@@ -65,6 +57,7 @@ class CTrip_FlightScraper:
         service = Service(ChromeDriverManager().install())
         self.driver = webdriver.Chrome(service=service, options=options)
         self.debug = debug
+        self.record_dir = record_dir
         
         # 设置隐式等待
         self.driver.implicitly_wait(10)
@@ -76,99 +69,10 @@ class CTrip_FlightScraper:
         :return: 航班列表
         """
         try:
-            log_print(f"正在访问链接: {url}")
-            log_print("请等待，页面加载中...")
-            
-            # 设置页面加载超时
-            self.driver.set_page_load_timeout(30)
-            
-            self.driver.get(url)
-            
-            # 先等待任何内容加载
-            time.sleep(3)
-            
-            # 尝试多个等待策略（优先级：flight-item -> item-inner -> product）
-            wait_selectors = [
-                ("flight-item", 10),      # 新版携程页面 CSS 类
-                ("item-inner", 10),       # 旧版选择器
-                ("product", 10),          # 备用选择器
-            ]
-            
-            element_found = False
-            for selector, timeout in wait_selectors:
-                try:
-                    WebDriverWait(self.driver, timeout).until(
-                        EC.presence_of_all_elements_located((By.CLASS_NAME, selector))
-                    )
-                    log_print(f"✓ 航班元素已加载 (类型: {selector})")
-                    element_found = True
-                    break
-                except:
-                    continue
-            
-            if not element_found:
-                log_print("⚠ 等待元素超时，尝试从已加载的HTML解析")
-            
-            # 额外等待确保动态内容加载完毕
-            time.sleep(5)
-            
-            # 获取页面源代码
-            page_source = self.driver.page_source
-            
-            if self.debug or len(page_source) < 1000:
-                # 保存页面源码供调试
-                debug_file = "debug_page.html"
-                with open(debug_file, 'w', encoding='utf-8') as f:
-                    f.write(page_source)
-                log_print(f"✓ 页面源码已保存到 {debug_file} (大小: {len(page_source)} 字节)")
-            
-            if len(page_source) < 100:
-                log_print("❌ 获取页面源代码失败，页面过小")
-                return []
-            
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            flights = []
-            
-            # 使用多个选择器尝试查找航班项
-            selectors = [
-                ('div', {'class': 'item-inner'}),
-                ('div', {'class': 'product'}),
-                ('div', {'class': 'flight-item'}),
-                ('div', {'class': 'search-item'}),
-                ('div', {'class': 'item'}),
-            ]
-            
-            flight_items = []
-            for tag, attrs in selectors:
-                flight_items = soup.find_all(tag, attrs=attrs)
-                if flight_items:
-                    log_print(f"✓ 使用选择器 {attrs} 找到 {len(flight_items)} 条记录")
-                    break
-            
-            if not flight_items:
-                log_print("❌ 未找到任何航班项")
-                # 尝试查看页面中是否有error或提示信息
-                error_elem = soup.find('div', class_='error')
-                if error_elem:
-                    log_print(f"页面提示: {error_elem.get_text()}")
+            page_source = self.fetch_page(url)
+            if page_source is None:
                 return []
-            
-            log_print(f"✓ 找到 {len(flight_items)} 条航班信息")
-            
-            for idx, item in enumerate(flight_items, 1):
-                try:
-                    # 过滤直飞航班
-                    flight_info = self.parse_flight_item(item, target_direct=direct_only)
-                    if flight_info:
-                        flights.append(flight_info)
-                        log_print(f"  ✓ 成功解析航班 {idx}")
-                except Exception as e:
-                    if self.debug:
-                        log_print(f"  ⚠ 解析航班 {idx} 出错: {e}")
-                    continue
-            
-            return flights
+            return parse_flights(page_source, direct_only=direct_only, debug=self.debug)
             
         except Exception as e:
             log_print(f"❌ 爬取航班信息失败: {e}")
@@ -176,13 +80,101 @@ class CTrip_FlightScraper:
             traceback.print_exc()
             return []
         finally:
-            log_print("正在关闭浏览器...")
+            self.close()
+
+    def fetch_page(self, url):
+        """
+        打开查询链接并等待航班列表加载完成
+        :param url: 携程航班查询链接
+        :return: 页面源代码；页面过小（加载失败）时返回 None
+        """
+        log_print(f"正在访问链接: {url}")
+        log_print("请等待，页面加载中...")
+        
+        # 设置页面加载超时
+        self.driver.set_page_load_timeout(30)
+        
+        self.driver.get(url)
+        
+        # 先等待任何内容加载
+        time.sleep(3)
+        
+        # 尝试多个等待策略（优先级：flight-item -> item-inner -> product）
+        wait_selectors = [
+            ("flight-item", 10),      # 新版携程页面 CSS 类
+            ("item-inner", 10),       # 旧版选择器
+            ("product", 10),          # 备用选择器
+        ]
+        
+        element_found = False
+        for selector, timeout in wait_selectors:
             try:
-                self.driver.quit()
+                WebDriverWait(self.driver, timeout).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, selector))
+                )
+                log_print(f"✓ 航班元素已加载 (类型: {selector})")
+                element_found = True
+                break
             except:
-                pass
+                continue
+        
+        if not element_found:
+            log_print("⚠ 等待元素超时，尝试从已加载的HTML解析")
+        
+        # 额外等待确保动态内容加载完毕
+        time.sleep(5)
+        
+        # 获取页面源代码
+        page_source = self.driver.page_source
+        
+        if self.debug or len(page_source) < 1000:
+            # 保存页面源码供调试
+            debug_file = "debug_page.html"
+            with open(debug_file, 'w', encoding='utf-8') as f:
+                f.write(page_source)
+            log_print(f"✓ 页面源码已保存到 {debug_file} (大小: {len(page_source)} 字节)")
+        
+        if self.record_dir:
+            self.record_page(url, page_source)
+        
+        if len(page_source) < 100:
+            log_print("❌ 获取页面源代码失败，页面过小")
+            return None
+        
+        return page_source
+
+    def record_page(self, url, page_source):
+        """
+        保存渲染完成的页面源码，供 replay.py 离线回放
+        目录结构：{record_dir}/{时间}_{航线}_{日期}/manifest.json、page.html
+        """
+        parsed = urlparse(url)
+        dep_date = parse_qs(parsed.query).get('depdate', [''])[0]
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.path.basename(parsed.path)}_{dep_date}"
+        record_path = os.path.join(self.record_dir, name)
+        os.makedirs(record_path, exist_ok=True)
+        
+        with open(os.path.join(record_path, 'page.html'), 'w', encoding='utf-8') as f:
+            f.write(page_source)
+        
+        manifest = {
+            'url': url,
+            'recorded_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'page': 'page.html',
+        }
+        with open(os.path.join(record_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        log_print(f"✓ 已录制页面到 {record_path}")
+
+    def close(self):
+        log_print("正在关闭浏览器...")
+        try:
+            self.driver.quit()
+        except:
+            pass
     
-    def parse_flight_item(self, item, target_flight_no=None, target_direct=True):
+    @staticmethod
+    def parse_flight_item(item, target_flight_no=None, target_direct=True):
         """
         解析单个航班项，可选过滤目标航班或直飞
         :param item: 航班元素
@@ -259,6 +251,57 @@ class CTrip_FlightScraper:
             log_print(f"  ✗ 解析单个航班出错: {e}")
             return None
 
+def parse_flights(page_source, direct_only=True, debug=False):
+    """
+    从页面源码中解析航班列表
+    :param page_source: 航班列表页源代码
+    :param direct_only: 是否仅保留直飞
+    :return: 航班列表
+    """
+    soup = BeautifulSoup(page_source, 'html.parser')
+    
+    flights = []
+    
+    # 使用多个选择器尝试查找航班项
+    selectors = [
+        ('div', {'class': 'item-inner'}),
+        ('div', {'class': 'product'}),
+        ('div', {'class': 'flight-item'}),
+        ('div', {'class': 'search-item'}),
+        ('div', {'class': 'item'}),
+    ]
+    
+    flight_items = []
+    for tag, attrs in selectors:
+        flight_items = soup.find_all(tag, attrs=attrs)
+        if flight_items:
+            log_print(f"✓ 使用选择器 {attrs} 找到 {len(flight_items)} 条记录")
+            break
+    
+    if not flight_items:
+        log_print("❌ 未找到任何航班项")
+        # 尝试查看页面中是否有error或提示信息
+        error_elem = soup.find('div', class_='error')
+        if error_elem:
+            log_print(f"页面提示: {error_elem.get_text()}")
+        return []
+    
+    log_print(f"✓ 找到 {len(flight_items)} 条航班信息")
+    
+    for idx, item in enumerate(flight_items, 1):
+        try:
+            # 过滤直飞航班
+            flight_info = CTrip_FlightScraper.parse_flight_item(item, target_direct=direct_only)
+            if flight_info:
+                flights.append(flight_info)
+                log_print(f"  ✓ 成功解析航班 {idx}")
+        except Exception as e:
+            if debug:
+                log_print(f"  ⚠ 解析航班 {idx} 出错: {e}")
+            continue
+    
+    return flights
+
 def save_flights_to_file(flights, filename='flights.json'):
     """
     将航班信息保存到JSON文件
@@ -271,78 +314,27 @@ def save_flights_to_file(flights, filename='flights.json'):
 def save_flights_to_excel(flights, dep_city_code, arr_city_code, dep_date, filename='flights_history.xlsx'):
     """
     将航班信息保存到Excel文件（每个航班单独一个sheet：城市对_日期_航空公司_航班号）
+    写入在文件锁内完成，多个查询进程同时结束时不会互相覆盖
+    写入失败（如工作簿被其他程序占用）时暂存，下次写入时合并
+    :return: (写入工作簿的查询结果, 是否已暂存)
+             写入成功时包含本次结果和一并合并的暂存结果；只暂存或失败时为空列表
     """
     query_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    dep_city_label = city_name(dep_city_code)
-    arr_city_label = city_name(arr_city_code)
-    
-    # 检查文件是否存在
-    if os.path.exists(filename):
-        wb = load_workbook(filename)
-    else:
-        wb = Workbook()
-        # 删除默认的Sheet
-        if 'Sheet' in wb.sheetnames:
-            wb.remove(wb['Sheet'])
-    
-    # 为每个航班创建单独的sheet
-    for flight in flights:
-        airline = flight.get('airline', '未知航空').replace('航空', '')
-        flight_no = flight.get('flight_number', 'N/A')
-        
-        # 生成sheet名称：城市对_日期_航空公司_航班号
-        sheet_name = f"{dep_city_label}-{arr_city_label}_{dep_date}_{airline}_{flight_no}"
-        
-        # Excel sheet名称长度限制为31个字符
-        if len(sheet_name) > 31:
-            sheet_name = f"{dep_city_label}-{arr_city_label}_{airline}_{flight_no}"[:31]
-        
-        # 检查sheet是否存在
-        if sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-        else:
-            ws = wb.create_sheet(sheet_name)
-            
-            # 创建表头
-            headers = ['查询时间', '出发城市', '目的地', '出发日期', '航空公司', '航班号', 
-                       '出发时间', '到达时间', '飞行时长', '价格(¥)']
-            ws.append(headers)
-            
-            # 设置表头样式
-            for cell in ws[1]:
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-        
-        # 添加数据行
-        row = [
-            query_time,
-            dep_city_label,
-            arr_city_label,
-            dep_date,
-            flight.get('airline', 'N/A'),
-            flight_no,
-            flight.get('departure_time', 'N/A'),
-            flight.get('arrival_time', 'N/A'),
-            flight.get('duration', 'N/A'),
-            flight.get('price', 'N/A')
-        ]
-        ws.append(row)
-        
-        # 自动调整列宽
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
-    wb.save(filename)
+    batch = (query_time, city_name(dep_city_code), city_name(arr_city_code), dep_date, flights)
+    merged = []
+    try:
+        write_batches([batch], filename, on_merged=merged.extend)
+    except Exception as e:
+        log_print(f"⚠ 写入 {filename} 失败: {e}")
+        try:
+            spool_batches([batch], filename)
+        except Exception as e:
+            log_print(f"❌ 暂存查询结果失败: {e}")
+            return [], False
+        log_print(f"⚠ 查询结果已暂存到 {spool_path(filename)}，下次写入时合并")
+        return [], True
     log_print(f"✓ 航班信息已保存到 {filename}（共 {len(flights)} 个sheet）")
+    return merged + [batch], False
 
 def display_flights(flights, dep_date, dep_city_code="hgh", arr_city_code="akl"):
     """
@@ -377,16 +369,12 @@ def display_flights(flights, dep_date, dep_city_code="hgh", arr_city_code="akl")
     log_print(f"✓ 找到 {len(flights)} 班直飞航班\n")
 
 
-def build_url(dep_city="hgh", arr_city="akl", dep_date="2026-09-25"):
+def build_url(dep_city="hgh", arr_city="akl", dep_date="2026-09-25", base_url=CTRIP_BASE_URL):
     return (
-        f"https://flights.ctrip.com/online/list/oneway-{dep_city}-{arr_city}?"
+        f"{base_url}/online/list/oneway-{dep_city}-{arr_city}?"
         f"depdate={dep_date}&cabin=y_s&adult=1&child=0&infant=0&containstax=1"
     )
 
-
-def city_name(code: str) -> str:
-    return CITY_LABELS.get(code.lower(), code.upper())
-
 # 调用示例：.\.venv\Scripts\python.exe .\query.py --from sha --to akl --date 2026-09-25
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="查询直飞航班")
@@ -402,12 +390,16 @@ if __name__ == "__main__":
                         help="关闭无头模式，显示浏览器窗口")
     parser.add_argument("--debug", action="store_true", default=False,
                         help="保存调试页面源码")
+    parser.add_argument("--record", dest="record_dir", default=None,
+                        help="录制页面到指定目录，供 replay.py 离线回放")
+    parser.add_argument("--base-url", dest="base_url", default=CTRIP_BASE_URL,
+                        help="查询站点地址，可指向 replay.py 启动的本地回放服务")
     args = parser.parse_args()
 
     dep_city = args.from_city.strip().lower()
     arr_city = args.to_city.strip().lower()
     
-    url = build_url(dep_city=dep_city, arr_city=arr_city, dep_date=args.dep_date)
+    url = build_url(dep_city=dep_city, arr_city=arr_city, dep_date=args.dep_date, base_url=args.base_url)
     dep_label = city_name(dep_city)
     arr_label = city_name(arr_city)
     
@@ -419,13 +411,21 @@ if __name__ == "__main__":
     log_print(f"目的地: {arr_label} ({arr_city.upper()})")
     log_print("-" * 80)
     
-    scraper = CTrip_FlightScraper(headless=args.headless, debug=args.debug)
+    scraper = CTrip_FlightScraper(headless=args.headless, debug=args.debug, record_dir=args.record_dir)
     flights = scraper.scrape_flights(url, direct_only=True)
     display_flights(flights, dep_date=args.dep_date, dep_city_code=dep_city, arr_city_code=arr_city)
     
     if flights:
         save_flights_to_file(flights, filename=f"flights_{dep_city}_{arr_city}_{args.dep_date}.json")
-        save_flights_to_excel(flights, dep_city, arr_city, args.dep_date)
+        written, _ = save_flights_to_excel(flights, dep_city, arr_city, args.dep_date)
+        # 只对真正写入工作簿的结果评估提醒；暂存的结果在之后合并写入时评估
+        alert_engine = load_alert_engine() if written else None
+        if alert_engine:
+            for query_time, dep_city_label, arr_city_label, batch_date, batch_flights in written:
+                try:
+                    alert_engine.observe(batch_flights, dep_city_label, arr_city_label, batch_date, query_time)
+                except Exception as e:
+                    log_print(f"⚠ 评估 {dep_city_label}→{arr_city_label} {batch_date} 价格提醒失败: {e}")
     else:
         log_print("⚠ 未保存任何航班信息")
         log_print("💡 建议: 已保存页面源码到 debug_page.html，请查看页面结构是否改变")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线回放服务：把 query.py --record 录制的页面通过本地HTTP服务重放，
+用于在不访问携程的情况下测试爬虫、保存和图表流程。
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+class ReplayStore:
+    """加载录制目录，按请求路径和出发日期查找页面"""
+
+    def __init__(self, recordings_dir):
+        self.pages = {}       # (路径, 出发日期) -> 页面内容
+        self.page_list = []   # 无精确匹配时轮流返回
+        self.recordings = []  # 录制时的原始URL
+        self._next = 0
+        self._lock = threading.Lock()
+
+        # 录制目录不存在时视为没有录制数据，由调用方给出提示
+        names = sorted(os.listdir(recordings_dir)) if os.path.isdir(recordings_dir) else []
+        for name in names:
+            manifest_path = os.path.join(recordings_dir, name, 'manifest.json')
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            with open(os.path.join(recordings_dir, name, manifest['page']), 'rb') as f:
+                page = f.read()
+            # 录制的是渲染后的DOM，去掉脚本避免回放时页面再去请求携程
+            page = re.sub(rb'<script\b[^>]*>.*?</script>', b'', page, flags=re.S | re.I)
+
+            parsed = urlparse(manifest['url'])
+            dep_date = parse_qs(parsed.query).get('depdate', [''])[0]
+            self.pages[(parsed.path, dep_date)] = page
+            self.page_list.append(page)
+            self.recordings.append(manifest['url'])
+
+    def find_page(self, path, dep_date):
+        page = self.pages.get((path, dep_date))
+        if page is not None or not self.page_list:
+            return page
+        with self._lock:
+            page = self.page_list[self._next % len(self.page_list)]
+            self._next += 1
+        return page
+
+
+class RateLimiter:
+    """限制回放速率（次/分钟），模拟真实站点的响应节奏"""
+
+    def __init__(self, rate_per_min):
+        self.interval = 60.0 / rate_per_min if rate_per_min > 0 else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(slot - now, 0))
+
+
+def make_handler(store, limiter, latency):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            page = None
+            if parsed.path.startswith('/online/list/'):
+                limiter.acquire()
+                dep_date = parse_qs(parsed.query).get('depdate', [''])[0]
+                page = store.find_page(parsed.path, dep_date)
+
+            if latency > 0:
+                time.sleep(latency)
+
+            if page is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def start_replay_server(recordings_dir, host='127.0.0.1', port=0, rate=0, latency=0.0):
+    """
+    在后台线程启动回放服务
+    :param rate: 页面请求速率上限（次/分钟），0 表示不限
+    :param latency: 每个响应额外延迟（秒）
+    :return: (server, store)，server.server_address 为实际监听地址
+    """
+    store = ReplayStore(recordings_dir)
+    server = ThreadingHTTPServer((host, port), make_handler(store, RateLimiter(rate), latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store
+
+
+# .venv\Scripts\python.exe replay.py --recordings recordings --port 8765
+# 然后：.venv\Scripts\python.exe query.py --from sha --to akl --date 2026-09-25 --base-url http://127.0.0.1:8765
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="回放录制的携程页面")
+    parser.add_argument("--recordings", default="recordings", help="录制目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=0, help="页面请求速率上限（次/分钟），0 表示不限")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个响应额外延迟（秒）")
+    args = parser.parse_args()
+
+    server, store = start_replay_server(args.recordings, args.host, args.port,
+                                        args.rate, args.latency)
+    log_print(f"✅ 已加载 {len(store.page_list)} 个页面")
+    log_print(f"✅ 回放服务已启动: http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        log_print("回放服务已停止")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按价值调度查询：根据历史价格波动、距出发天数、距上次查询时间为每个 (航线, 日期) 打分，
+在每个时间窗口的固定查询预算内优先执行最有价值的查询。
+"""
+
+import argparse
+import json
+import os
+import statistics
+from datetime import datetime
+from collections import defaultdict
+
+from cities import city_name
+from history_reader import iter_history_rows, parse_query_time, parse_price
+
+# 各项得分权重（总和为 1）
+WEIGHTS = {
+    'volatility': 0.40,   # 近期价格波动
+    'urgency': 0.35,      # 距出发越近越重要
+    'staleness': 0.25,    # 越久没查越重要
+}
+
+VOLATILITY_LOOKBACK = 10      # 计算波动时使用的最近查询次数
+VOLATILITY_SATURATION = 0.05  # 变异系数达到 5% 即视为最大波动
+URGENCY_HALF_DAYS = 14        # 距出发 14 天时紧迫度为 0.5
+STALENESS_FULL_HOURS = 24     # 超过 24 小时未查询视为完全过期
+UNKNOWN_VOLATILITY = 0.5      # 没有足够历史时的波动先验
+
+
+def log_print(msg):
+    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    print(f"{timestamp} {msg}")
+
+
+def load_scrape_history(filename='flights_history.xlsx'):
+    """
+    读取历史记录，返回 {(出发城市, 目的地, 出发日期): {查询时间: 当次最低价}}
+    以只读模式逐行读取，不把整个工作簿载入内存
+    """
+    history = defaultdict(dict)
+    if not os.path.exists(filename):
+        return history
+
+    required = ('查询时间', '出发城市', '目的地', '出发日期', '价格(¥)')
+    for _, _, row in iter_history_rows(filename, required=required):
+        query_time = parse_query_time(row['查询时间'])
+        price = parse_price(row['价格(¥)'])
+        if query_time is None or price is None:
+            continue
+        key = (row['出发城市'], row['目的地'], str(row['出发日期']))
+        # 同一次查询会写入多个航班，只保留该次查询的最低价
+        prices = history[key]
+        if query_time not in prices or price < prices[query_time]:
+            prices[query_time] = price
+    return history
+
+
+def score_query(observations, dep_date, now):
+    """
+    计算单个查询的优先级
+    :param observations: {查询时间: 最低价}，可为空
+    :param dep_date: 出发日期 YYYY-MM-DD
+    :param now: 当前时间
+    :return: (得分, 各项明细)；已过出发日期时返回 (None, None)
+    """
+    days_left = (datetime.strptime(dep_date, "%Y-%m-%d").date() - now.date()).days
+    if days_left < 0:
+        return None, None
+
+    times = sorted(observations)
+    recent = [observations[t] for t in times[-VOLATILITY_LOOKBACK:]]
+    if len(recent) >= 2:
+        cv = statistics.pstdev(recent) / statistics.mean(recent)
+        volatility = min(cv / VOLATILITY_SATURATION, 1.0)
+    else:
+        volatility = UNKNOWN_VOLATILITY
+
+    urgency = URGENCY_HALF_DAYS / (URGENCY_HALF_DAYS + days_left)
+
+    if times:
+        hours_since = (now - times[-1]).total_seconds() / 3600
+        staleness = min(max(hours_since, 0) / STALENESS_FULL_HOURS, 1.0)
+    else:
+        staleness = 1.0
+
+    detail = {
+        'volatility': round(volatility, 3),
+        'urgency': round(urgency, 3),
+        'staleness': round(staleness, 3),
+        'days_left': days_left,
+        'samples': len(times),
+    }
+    score = sum(WEIGHTS[name] * detail[name] for name in WEIGHTS)
+    return score, detail
+
+
+def plan_window(queries, history, budget, now=None):
+    """
+    在查询预算内挑选本窗口要执行的查询，按优先级从高到低排序
+    :param queries: config.json 中的查询列表
+    :param history: load_scrape_history 的返回值
+    :param budget: 本窗口最多执行的查询数，<=0 表示不限
+    :return: [(得分, 明细, 查询)]
+    """
+    now = now or datetime.now()
+    ranked = []
+    seen = set()
+    for q in queries:
+        dep, arr, date = q.get('from', ''), q.get('to', ''), q.get('date', '')
+        if not (dep and arr and date) or (dep, arr, date) in seen:
+            continue
+        seen.add((dep, arr, date))
+        try:
+            observations = history.get((city_name(dep), city_name(arr), date), {})
+            score, detail = score_query(observations, date, now)
+        except ValueError:
+            continue
+        if score is not None:
+            ranked.append((score, detail, q))
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    if budget > 0:
+        ranked = ranked[:budget]
+    return ranked
+
+
+# .venv\Scripts\python.exe scheduler.py --budget 2
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="按价值挑选本时间窗口要执行的查询")
+    parser.add_argument("--config", default="config.json", help="查询配置文件")
+    parser.add_argument("--history", default="flights_history.xlsx", help="历史记录Excel文件")
+    parser.add_argument("--budget", type=int, default=0, help="本窗口最多执行的查询数，0 表示不限")
+    parser.add_argument("--json", action="store_true", default=False,
+                        help="只向标准输出打印选中的查询（JSON数组），供调度器读取")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        queries = json.load(f).get('queries', [])
+
+    plan = plan_window(queries, load_scrape_history(args.history), args.budget)
+
+    if args.json:
+        print(json.dumps([q for _, _, q in plan], ensure_ascii=False))
+    else:
+        log_print(f"✅ 本窗口计划执行 {len(plan)} / {len(queries)} 个查询")
+        for score, detail, q in plan:
+            log_print(f"  {q['from']}→{q['to']} {q['date']}  得分 {score:.3f}  "
+                      f"波动 {detail['volatility']}  紧迫 {detail['urgency']}  "
+                      f"过期 {detail['staleness']}  剩余 {detail['days_left']} 天  样本 {detail['samples']}")